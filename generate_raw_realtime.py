@@ -2,15 +2,46 @@
 import sys
 import time
 import socket
-import subprocess
 import argparse
 import os
-import select
+import selectors
 from collections import deque
+from itertools import chain
+
+import av
+
+# longest single wait in a selector, epoll rejects timeouts that overflow its millisecond int
+MAX_SELECT_TIMEOUT = 3600
+
+def decode_pcm(container):
+    """
+    Decodes the first audio stream of an opened container in-process.
+    
+    Args:
+        container: av.container.InputContainer to decode
+    
+    Yields:
+        Blocks of raw 16-bit, 16kHz, mono PCM
+    """
+    stream = container.streams.audio[0]
+    resampler = av.AudioResampler(format='s16', layout='mono', rate=16000)
+    # The trailing None flushes the samples buffered inside the resampler
+    for frame in chain(container.decode(stream), [None]):
+        for r in resampler.resample(frame):
+            # s16 mono is packed into a single plane, which may be padded
+            yield memoryview(r.planes[0])[:r.samples * 2]
+
+def fill_pcm_buffer(blocks, buf, size):
+    """Appends decoded PCM blocks to buf until it holds at least size bytes or the decoder is exhausted"""
+    while len(buf) < size:
+        block = next(blocks, None)
+        if block is None:
+            return
+        buf += block
 
 def send_audio_in_chunks(audio_file_path, host, port, chunk_seconds=2.0):
     """
-    Converts audio file to raw PCM using ffmpeg and sends it to a server in timed chunks.
+    Decodes audio file to raw PCM using PyAV and sends it to a server in timed chunks.
     Receives responses after each chunk is sent and measures processing time.
     
     Args:
@@ -19,43 +50,34 @@ def send_audio_in_chunks(audio_file_path, host, port, chunk_seconds=2.0):
         port: Server port
         chunk_seconds: Size of each chunk in seconds
     """
-    # Get audio duration and info using ffprobe
-    duration_cmd = [
-        'ffprobe', 
-        '-v', 'error', 
-        '-show_entries', 'format=duration', 
-        '-of', 'default=noprint_wrappers=1:nokey=1', 
-        audio_file_path
-    ]
-    
+    # Open the audio file and get its duration from the container header
     try:
-        duration = float(subprocess.check_output(duration_cmd).decode('utf-8').strip())
-        print(f"Audio duration: {duration:.2f} seconds")
+        container = av.open(audio_file_path)
     except Exception as e:
-        print(f"Error getting audio duration: {e}")
+        print(f"Error opening audio file: {e}")
+        return
+    if container.duration is None:
+        print("Error getting audio duration: not stored in the container")
+        container.close()
         return
+    duration = container.duration / av.time_base
+    print(f"Audio duration: {duration:.2f} seconds")
     
     # Calculate bytes per second for 16-bit, 16kHz, mono audio
     bytes_per_second = 16000 * 2  # Sample rate * bytes per sample
     chunk_size = int(bytes_per_second * chunk_seconds)
     
-    # Set up ffmpeg command to convert audio to raw PCM
-    ffmpeg_cmd = [
-        'ffmpeg',
-        '-i', audio_file_path,
-        '-f', 's16le',
-        '-acodec', 'pcm_s16le',
-        '-ar', '16000',
-        '-ac', '1',
-        '-'
-    ]
-    
     # Connect to server
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
-    # Increase TCP send buffer size (e.g., to 1MB or more)
-    # send_buffer_size = 1024 * 1024 * 1024  # 5MB
-    # sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, send_buffer_size)
+    # Send each chunk right away instead of letting Nagle hold back its tail
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    # Increase TCP send buffer size so a whole chunk fits in few send calls.
+    # This is only a request: the kernel caps it at net.core.wmem_max (about 208 KB by default on Linux),
+    # and a fixed size turns off send buffer autotuning.
+    send_buffer_size = 1 << 20  # 1MB requested
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, send_buffer_size)
 
     # Check what was actually set
     # actual_size = sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
@@ -65,19 +87,24 @@ def send_audio_in_chunks(audio_file_path, host, port, chunk_seconds=2.0):
     # FIFO queue to track timestamps for sent chunks
     chunk_timestamps = deque()
     
+    # epoll/kqueue based selector, the socket is registered once after connecting
+    sel = selectors.DefaultSelector()
+    # reused buffer for server responses
+    recv_buf = bytearray(4096)
+    
     try:
         sock.connect((host, port))
         print(f"Connected to {host}:{port}")
         
         # Make socket non-blocking for receiving responses without waiting
         sock.setblocking(0)
+        sel.register(sock, selectors.EVENT_READ)
         
-        # Start ffmpeg process
-        ffmpeg_process = subprocess.Popen(
-            ffmpeg_cmd, 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE
-        )
+        # Convert the audio file to raw PCM in-process
+        pcm_blocks = decode_pcm(container)
+        pcm_buffer = bytearray()
+        # zeros used to pad the final chunk, allocated once
+        silence = bytes(chunk_size)
         
         total_bytes_sent = 0
         chunk_count = 0
@@ -85,51 +112,65 @@ def send_audio_in_chunks(audio_file_path, host, port, chunk_seconds=2.0):
         # Send data in chunks
         while True:
             # Read chunk of PCM data
-            data = ffmpeg_process.stdout.read(chunk_size)
+            fill_pcm_buffer(pcm_blocks, pcm_buffer, chunk_size)
+            data_len = min(len(pcm_buffer), chunk_size)
             
             # If no more data, break
-            if not data:
+            if not data_len:
                 break
             
-            # Send the data
+            # Send the data straight from the decode buffer, without copying it into a bytes object
             send_time = time.time()
-            sock.sendall(data)
+            with memoryview(pcm_buffer) as view:
+                sock.sendall(view[:data_len])
+            del pcm_buffer[:data_len]
             
             # Record the chunk number and timestamp in the queue
             chunk_count += 1
             chunk_timestamps.append((chunk_count, send_time))
             
-            total_bytes_sent += len(data)
+            total_bytes_sent += data_len
             
-            chunk_duration = len(data) / bytes_per_second
-            print(f"Sent chunk {chunk_count}: {len(data)} bytes ({chunk_duration:.2f} seconds) at {send_time:.6f}")
+            chunk_duration = data_len / bytes_per_second
+            print(f"Sent chunk {chunk_count}: {data_len} bytes ({chunk_duration:.2f} seconds) at {send_time:.6f}")
 
             # Check if this is a partial final chunk that needs padding
-            if len(data) < chunk_size and chunk_duration < chunk_seconds:
+            if data_len < chunk_size and chunk_duration < chunk_seconds:
                 # Calculate how many bytes of silence to add
-                silence_bytes_needed = chunk_size - len(data)
-                # Create silence padding (zeros for PCM)
-                silence_padding = b'\x00' * silence_bytes_needed
+                silence_bytes_needed = chunk_size - data_len
                 print(f"Padding final chunk with {silence_bytes_needed} bytes of silence")
-                sock.sendall(silence_padding)
+                sock.sendall(memoryview(silence)[:silence_bytes_needed])
                 total_bytes_sent += silence_bytes_needed
             
             # Try to receive response immediately after sending each chunk
-            try_receive_response(sock, chunk_timestamps)
+            try_receive_response(sock, sel, recv_buf, chunk_timestamps)
                 
             # Sleep to simulate real-time streaming
             # Only if there's more data to send
-            if ffmpeg_process.stdout.peek():
+            fill_pcm_buffer(pcm_blocks, pcm_buffer, chunk_size)
+            if pcm_buffer:
                 # While sleeping, continue checking for responses
                 start_time = time.time()
-                while time.time() - start_time < chunk_seconds:
-                    try_receive_response(sock, chunk_timestamps)
-                    time.sleep(0.1)  # Short sleep to avoid CPU spinning
+                remaining = chunk_seconds
+                while remaining > 0:
+                    if not chunk_timestamps:
+                        # No response expected, just wait out the pacing budget
+                        time.sleep(remaining)
+                        break
+                    # Block in select until a response arrives or the pacing budget runs out
+                    received = try_receive_response(sock, sel, recv_buf, chunk_timestamps, remaining)
+                    if received is None:
+                        # Connection closed or receive error, keep pacing without reading
+                        time.sleep(max(chunk_seconds - (time.time() - start_time), 0))
+                        break
+                    if not received:
+                        break
+                    remaining = chunk_seconds - (time.time() - start_time)
             
         print(f"Finished sending {chunk_count} chunks ({total_bytes_sent} bytes)")
         
         # Wait a bit more for any final responses
-        wait_for_final_responses(sock, chunk_timestamps)
+        wait_for_final_responses(sock, sel, recv_buf, chunk_timestamps)
         
         # Report any chunks that never received responses
         if chunk_timestamps:
@@ -142,8 +183,8 @@ def send_audio_in_chunks(audio_file_path, host, port, chunk_seconds=2.0):
         print(f"Error: {e}")
     finally:
         # Clean up
-        if 'ffmpeg_process' in locals() and ffmpeg_process:
-            ffmpeg_process.terminate()
+        container.close()
+        sel.close()
         sock.close()
         print("Connection closed")
 
@@ -172,31 +213,39 @@ def send_audio_in_chunks(audio_file_path, host, port, chunk_seconds=2.0):
 #     except Exception as e:
 #         print(f"Error receiving data: {e}")
 
-def try_receive_response(sock, chunk_timestamps):
+def try_receive_response(sock, sel, recv_buf, chunk_timestamps, timeout=0):
     """
-    Attempt to receive response from socket without blocking
+    Attempt to receive response from socket, waiting at most timeout seconds
     
     Args:
         sock: Socket to receive from
+        sel: Selector that sock is registered with for reading
+        recv_buf: Reused bytearray the response is received into
         chunk_timestamps: FIFO queue of (chunk_number, timestamp) tuples
+        timeout: Maximum time to wait for data in seconds, 0 polls without blocking,
+            capped at MAX_SELECT_TIMEOUT
+    
+    Returns:
+        True if response data was received, False on timeout or if no chunks are waiting,
+        None if the connection was closed or receiving failed
     """
     # Skip if there are no chunks waiting for responses
     if not chunk_timestamps:
-        return
+        return False
     
-    # Use select to check if there's data available to read
-    # sock.settimeout(0.5)  # 500ms timeout
-
-    readable, _, _ = select.select([sock], [], [], 0)
-    if readable:
+    # Use select to wait until there's data available to read
+    timeout = min(max(timeout, 0), MAX_SELECT_TIMEOUT)
+    readable = [key.fileobj for key, _ in sel.select(timeout)]
+    if sock in readable:
         try:
             # There's data available to read
-            response = sock.recv(4096)
-            if response:
+            n = sock.recv_into(recv_buf)
+            if n:
+                response = memoryview(recv_buf)[:n]
                 # Split by newline to separate messages
                 # print how many bytes received
                 print(f"Received {len(response)} bytes of response data")
-                messages = response.decode('utf-8', errors='replace').strip().split('\n')
+                messages = str(response, 'utf-8', errors='replace').strip().split('\n')
                 
                 for message in messages:
                     if message and chunk_timestamps:  # Skip empty messages
@@ -211,21 +260,25 @@ def try_receive_response(sock, chunk_timestamps):
                         print(f"  Content: {message}")
                         print(f"  Received at: {receive_time:.6f}")
                         print(f"  Sent at: {send_time:.6f}")
+                return True
+            return None
                     
         except Exception as e:
             print(f"Error receiving data: {e}")
+            return None
+    return False
 
-def check_for_additional_responses(sock, chunk_timestamps):
+def check_for_additional_responses(sock, sel, recv_buf, chunk_timestamps):
     """Check for additional responses without delay"""
     while chunk_timestamps:
         # Check if more data is available immediately
-        readable, _, _ = select.select([sock], [], [], 0)
-        if not readable:
+        readable = [key.fileobj for key, _ in sel.select(0)]
+        if sock not in readable:
             break
             
         try:
-            response = sock.recv(4096)
-            if not response:
+            n = sock.recv_into(recv_buf)
+            if not n:
                 break
                 
             # Get the oldest chunk's info
@@ -236,17 +289,19 @@ def check_for_additional_responses(sock, chunk_timestamps):
             # Display the response with timing information
             print(f"\nResponse for chunk {chunk_num}:")
             print(f"  Processing time: {processing_time:.6f} seconds")
-            print(f"  Content: {response.decode('utf-8', errors='replace')}")
+            print(f"  Content: {str(memoryview(recv_buf)[:n], 'utf-8', errors='replace')}")
         except Exception as e:
             print(f"Error receiving additional data: {e}")
             break
 
-def wait_for_final_responses(sock, chunk_timestamps, timeout=500000000):
+def wait_for_final_responses(sock, sel, recv_buf, chunk_timestamps, timeout=500000000):
     """
     Wait for any final responses from the server
     
     Args:
         sock: Socket to receive from
+        sel: Selector that sock is registered with for reading
+        recv_buf: Reused bytearray responses are received into
         chunk_timestamps: FIFO queue of (chunk_number, timestamp) tuples
         timeout: Maximum time to wait in seconds
     """
@@ -257,12 +312,13 @@ def wait_for_final_responses(sock, chunk_timestamps, timeout=500000000):
     end_time = time.time() + timeout
     
     while time.time() < end_time and chunk_timestamps:
-        try_receive_response(sock, chunk_timestamps)
-        time.sleep(0.1)  # Short sleep to avoid CPU spinning
+        # a single wait is capped at MAX_SELECT_TIMEOUT, so a timeout just waits again until end_time
+        if try_receive_response(sock, sel, recv_buf, chunk_timestamps, end_time - time.time()) is None:
+            break
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Stream audio to server in real-time chunks')
-    parser.add_argument('audio_file', help='Path to audio file (any format ffmpeg supports)')
+    parser.add_argument('audio_file', help='Path to audio file (any format libav supports)')
     parser.add_argument('--host', default='localhost', help='Server hostname or IP')
     parser.add_argument('--port', type=int, default=43001, help='Server port')
     parser.add_argument('--interval', type=float, default=2.0, help='Chunk interval in seconds')
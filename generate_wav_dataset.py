@@ -1,6 +1,8 @@
 import numpy as np
 import soundfile as sf
 from datasets import load_dataset
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 import os
 
 repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -18,50 +20,52 @@ def numpy_to_wav(audio_data, output_filename, sampling_rate=16000):
     sampling_rate : int, optional
         Sampling rate of the audio, by default 16000
     """
-    # Ensure the array is float32 for best compatibility
-    if audio_data.dtype != np.float32:
-        audio_data = audio_data.astype(np.float32)
+    # Convert float samples in [-1, 1] to 16-bit PCM, half the size of float32 WAV
+    if audio_data.dtype != np.int16:
+        audio_data = np.clip(audio_data * 32767, -32768, 32767).astype(np.int16)
     
-    # Write the NumPy array directly to a WAV file
-    sf.write(output_filename, audio_data, sampling_rate)
+    # Write the NumPy array directly to a 16-bit PCM WAV file
+    sf.write(output_filename, audio_data, sampling_rate, subtype='PCM_16')
     print(f"WAV file saved as {output_filename}")
 
 # Example usage
 def main():
-    # Load the dataset (similar to your original code)
-    livecaptions_prompts = []
-    
-    def load_livecaptions_dataset():
-        """Load the live captions dataset"""
-        ds_livecaptions = load_dataset("distil-whisper/earnings21")
-        ds_livecaptions = ds_livecaptions["test"]
-        for item in ds_livecaptions:
-            livecaptions_prompts.append(item['audio'])
-            break
-        return len(ds_livecaptions)
-    
-    # Load the dataset
-    total_items = load_livecaptions_dataset()
-    print(f"Loaded {total_items} audio files from dataset")
+    # Stream the dataset so that items are fetched one by one instead of materializing the whole split
+    ds_livecaptions = load_dataset("distil-whisper/earnings21", split="test", streaming=True)
     
     # Process all files
     output_dir = f"{repo_dir}/applications/LiveCaptions/whisper-earnings21"
-    import os
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
-    # Convert each numpy array to a WAV file
-    for i, audio_item in enumerate(livecaptions_prompts):
-        audio_array = audio_item['array']
-        sampling_rate = audio_item['sampling_rate']
-        original_path = audio_item['path']
-        
-        # Extract filename from path (without extension)
-        filename = os.path.splitext(os.path.basename(original_path))[0]
-        output_filename = os.path.join(output_dir, f"{filename}.wav")
+    # Convert each numpy array to a WAV file, overlapping the writes with fetching the next items.
+    # At most max_pending items are held in memory; waiting on the oldest one also surfaces its errors.
+    max_workers = 4
+    max_pending = 2 * max_workers
+    pending = deque()
+    converted = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for i, item in enumerate(ds_livecaptions):
+            audio_item = item['audio']
+            original_path = audio_item['path']
+            
+            # Extract filename from path (without extension)
+            filename = os.path.splitext(os.path.basename(original_path))[0]
+            output_filename = os.path.join(output_dir, f"{filename}.wav")
+            
+            if os.path.exists(output_filename):
+                print(f"Skipping file {i+1}: {output_filename} already exists")
+                continue
+            
+            print(f"Converting file {i+1}: {original_path}")
+            if len(pending) >= max_pending:
+                pending.popleft().result()
+            pending.append(executor.submit(numpy_to_wav, audio_item['array'], output_filename, audio_item['sampling_rate']))
+            converted += 1
         
-        print(f"Converting file {i+1}/{len(livecaptions_prompts)}: {original_path}")
-        numpy_to_wav(audio_array, output_filename, sampling_rate)
+        while pending:
+            pending.popleft().result()
+    print(f"Converted {converted} audio files from dataset")
 
 if __name__ == "__main__":
     main()
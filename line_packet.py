@@ -15,6 +15,18 @@ Originally from the UEDIN team of the ELITR project.
 PACKET_SIZE = 65536
 
 
+def _encode_line(text):
+    """Returns the first line of 'text' as UTF-8 bytes, without the line break.
+
+    Line boundaries are determined by str.splitlines(), and '\0' is also
+    counted as a line terminator.
+    """
+    lines = text.replace('\0', '\n').splitlines()
+    first_line = '' if len(lines) == 0 else lines[0]
+    # TODO Is there a better way of handling bad input than 'replace'?
+    return first_line.encode('utf-8', errors='replace')
+
+
 def send_one_line(socket, text, pad_zeros=False):
     """Sends a line of text over the given socket.
 
@@ -31,11 +43,7 @@ def send_one_line(socket, text, pad_zeros=False):
         socket: a socket object.
         text: string containing a line of text for transmission.
     """
-    text.replace('\0', '\n')
-    lines = text.splitlines()
-    first_line = '' if len(lines) == 0 else lines[0]
-    # TODO Is there a better way of handling bad input than 'replace'?
-    data = first_line.encode('utf-8', errors='replace') + b'\n' + (b'\0' if pad_zeros else b'')
+    data = _encode_line(text) + b'\n' + (b'\0' if pad_zeros else b'')
     for offset in range(0, len(data), PACKET_SIZE):
         bytes_remaining = len(data) - offset
         if bytes_remaining < PACKET_SIZE:
@@ -46,6 +54,32 @@ def send_one_line(socket, text, pad_zeros=False):
         socket.sendall(packet)
 
 
+def send_lines(socket, lines):
+    """Sends several lines of text over the given socket with one sendmsg call.
+
+    Each element of 'lines' is framed like in send_one_line (without zero
+    padding): only its first line is sent, followed by a newline. The encoded
+    lines and their newlines are passed to sendmsg as separate buffers, so
+    they are not concatenated before sending. If sendmsg writes only part of
+    the data, the rest is sent with sendall.
+
+    If the send fails then an exception will be raised.
+
+    Args:
+        socket: a socket object.
+        lines: list of strings, each containing a line of text for transmission.
+    """
+    if not lines:
+        return
+    bufs = []
+    for text in lines:
+        bufs.append(_encode_line(text))
+        bufs.append(b'\n')
+    sent = socket.sendmsg(bufs)
+    if sent < sum(len(b) for b in bufs):
+        socket.sendall(b''.join(bufs)[sent:])
+
+
 def receive_one_line(socket):
     """Receives a line of text from the given socket.
 
@@ -1,8 +1,7 @@
 import os
 import wave
 import argparse
-import numpy as np
-from pydub import AudioSegment
+import math
 
 def get_duration(wav_file_path):
     """Get the duration of a WAV file in seconds."""
@@ -32,40 +31,39 @@ def split_wav_file(input_wav, output_dir, chunk_length=60):
     # Get filename without extension
     base_filename = os.path.splitext(os.path.basename(input_wav))[0]
     
-    # Load the audio file
+    # Read the format from the header, the sample data is read chunk by chunk
     print(f"Loading audio file: {input_wav}")
-    audio = AudioSegment.from_wav(input_wav)
-    
-    # Get total duration in milliseconds
-    total_duration_ms = len(audio)
-    total_duration_sec = total_duration_ms / 1000
-    
-    # Calculate number of chunks
-    chunk_length_ms = chunk_length * 1000
-    num_chunks = int(np.ceil(total_duration_ms / chunk_length_ms))
-    
-    print(f"Audio duration: {total_duration_sec:.2f} seconds ({total_duration_sec/60:.2f} minutes)")
-    print(f"Splitting into {num_chunks} chunks of {chunk_length} seconds each")
-    
-    # Split and save chunks
-    for i in range(num_chunks):
-        start_ms = i * chunk_length_ms
-        end_ms = min((i + 1) * chunk_length_ms, total_duration_ms)
-        
-        # Extract chunk
-        chunk = audio[start_ms:end_ms]
+    with wave.open(input_wav, 'rb') as wf:
+        params = wf.getparams()
         
-        # Generate output filename
-        output_filename = f"{base_filename}_chunk_{i+1:03d}.wav"
-        output_path = os.path.join(output_dir, output_filename)
+        # Get total duration in seconds
+        total_duration_sec = params.nframes / params.framerate
         
-        # Save chunk
-        chunk.export(output_path, format="wav")
+        # Calculate number of chunks
+        frames_per_chunk = chunk_length * params.framerate
+        num_chunks = math.ceil(params.nframes / frames_per_chunk)
         
-        # Calculate chunk duration
-        chunk_duration = (end_ms - start_ms) / 1000
+        print(f"Audio duration: {total_duration_sec:.2f} seconds ({total_duration_sec/60:.2f} minutes)")
+        print(f"Splitting into {num_chunks} chunks of {chunk_length} seconds each")
         
-        print(f"Saved chunk {i+1}/{num_chunks}: {output_filename} ({chunk_duration:.2f} seconds)")
+        # Split and save chunks
+        for i in range(num_chunks):
+            # Read the next chunk sequentially
+            chunk = wf.readframes(frames_per_chunk)
+            
+            # Generate output filename
+            output_filename = f"{base_filename}_chunk_{i+1:03d}.wav"
+            output_path = os.path.join(output_dir, output_filename)
+            
+            # Save chunk with the same format as the input, without re-encoding
+            with wave.open(output_path, 'wb') as out:
+                out.setparams(params)
+                out.writeframesraw(chunk)
+            
+            # Calculate chunk duration
+            chunk_duration = len(chunk) / (params.nchannels * params.sampwidth) / params.framerate
+            
+            print(f"Saved chunk {i+1}/{num_chunks}: {output_filename} ({chunk_duration:.2f} seconds)")
 
 def main():
     parser = argparse.ArgumentParser(description='Split a WAV file into chunks of specified length')
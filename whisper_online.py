@@ -23,6 +23,16 @@ def load_audio_chunk(fname, beg, end):
     end_s = int(end*16000)
     return audio[beg_s:end_s]
 
+def pcm16_to_float32(audio):
+    """Returns audio as float samples in [-1,1), like load_audio.
+    int16 PCM is scaled to float32, float audio is returned unchanged. Other dtypes raise ValueError.
+    """
+    if audio.dtype == np.int16:
+        return np.multiply(audio, np.float32(1.0/32768.0), dtype=np.float32)
+    if not np.issubdtype(audio.dtype, np.floating):
+        raise ValueError(f"Unsupported audio dtype {audio.dtype}: expected float samples or int16 PCM")
+    return audio
+
 
 # Whisper backend
 
@@ -458,7 +468,8 @@ class OnlineASRProcessor:
         self.commited = []
 
     def insert_audio_chunk(self, audio):
-        self.audio_buffer = np.append(self.audio_buffer, audio)
+        """audio: float samples in [-1,1) or int16 PCM, which is scaled to float32. Other dtypes raise ValueError."""
+        self.audio_buffer = np.append(self.audio_buffer, pcm16_to_float32(audio))
 
     def prompt(self):
         """Returns a tuple: (prompt, context), where "prompt" is a 200-character suffix of commited text that is inside of the scrolled away part of audio buffer. 
@@ -673,6 +684,8 @@ class VACOnlineASRProcessor(OnlineASRProcessor):
 
 
     def insert_audio_chunk(self, audio):
+        """audio: float samples in [-1,1) or int16 PCM, which is scaled to float32. Other dtypes raise ValueError."""
+        audio = pcm16_to_float32(audio)
         res = self.vac(audio)
         self.audio_buffer = np.append(self.audio_buffer, audio)
 
@@ -783,7 +796,7 @@ def add_shared_args(parser):
     parser.add_argument('--buffer_trimming', type=str, default="segment", choices=["sentence", "segment"],help='Buffer trimming strategy -- trim completed sentences marked with punctuation mark and detected by sentence segmenter, or the completed segments returned by Whisper. Sentence segmenter must be installed for "sentence" option.')
     parser.add_argument('--buffer_trimming_sec', type=float, default=15, help='Buffer trimming length threshold in seconds. If buffer length is longer, trimming sentence/segment is triggered.')
     # parser.add_argument("--device", default="gpu", choices=["cpu","gpu"], help="Device to use for inference. Default is gpu. If you want to use CPU, set it to cpu.")
-    parser.add_argument("-l", "--log-level", dest="log_level", choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'], help="Set the log level", default='DEBUG')
+    parser.add_argument("-l", "--log-level", dest="log_level", choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'], help="Set the log level", default='INFO')
 
 def asr_factory(args, logfile=sys.stderr):
     """
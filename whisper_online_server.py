@@ -52,24 +52,51 @@ else:
 
 import line_packet
 import socket
+import selectors
+import queue
+import threading
 
 class Connection:
     '''it wraps conn object'''
     # do 2 second
     PACKET_SIZE = 2*SAMPLING_RATE*2 # 2 seconds of audio, 16 bit, mono
+    CHUNK_SECONDS = PACKET_SIZE / (2*SAMPLING_RATE)
+    # a partially received chunk is returned after this many seconds without completing it
+    RECEIVE_TIMEOUT = 1.5*CHUNK_SECONDS
 
     def __init__(self, conn):
         self.conn = conn
         self.last_line = ""
 
-        self.conn.setblocking(True)
+        # no single socket operation may block indefinitely, waiting for data is done in the selector
+        self.conn.settimeout(self.RECEIVE_TIMEOUT)
+        self.sel = selectors.DefaultSelector()
+        self.sel.register(self.conn, selectors.EVENT_READ)
+        # responses are small lines, send them without Nagle delay
+        self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        # preallocated receive buffer, filled in place by recv_into
+        self._buf = bytearray(self.PACKET_SIZE)
+        self._mv = memoryview(self._buf)
+        # trailing bytes of an incomplete sample, kept for the next chunk
+        self._carry = b''
+
+    def close(self):
+        self.sel.close()
+        self.conn.close()
 
     def send(self, line):
         '''it doesn't send the same line twice, because it was problematic in online-text-flow-events'''
         # if line == self.last_line:
         #     return
-        line_packet.send_one_line(self.conn, line)
-        self.last_line = line
+        self.send_lines([line])
+
+    def send_lines(self, lines):
+        '''sends all lines with one scatter-gather sendmsg call'''
+        if not lines:
+            return
+        line_packet.send_lines(self.conn, lines)
+        self.last_line = lines[-1]
         
 
     def receive_lines(self):
@@ -83,48 +110,56 @@ class Connection:
     #     except ConnectionResetError:
     #         return None
 
-    def non_blocking_receive_audio(self):
+    def non_blocking_receive_audio(self, out=None, min_size=2):
         """
         Receives audio data, handling cases where TCP may split a single chunk into multiple packets.
-        Returns complete chunks of PACKET_SIZE bytes, or None if connection closed.
+        Returns chunks of PACKET_SIZE bytes, or None if connection closed.
+        If the chunk is not complete within RECEIVE_TIMEOUT seconds, the whole samples received so far
+        are returned, so that a stalled sender doesn't stall the ASR. The wait continues while
+        fewer than min_size bytes are received.
+        If out (a writable buffer of PACKET_SIZE bytes) is given, the chunk is received into it
+        and a memoryview of its filled part is returned instead of a new bytes object.
         """
+        mv = self._mv if out is None else memoryview(out)
         try:
-            # Initialize buffer for collecting fragmented data
-            buffer = b''
-            bytes_needed = self.PACKET_SIZE
-            
-            # Keep receiving until we have a complete packet
-            while len(buffer) < self.PACKET_SIZE:
-                # Try to receive remaining bytes needed
-                fragment = self.conn.recv(bytes_needed)
+            off = len(self._carry)
+            mv[:off] = self._carry
+            deadline = time.monotonic() + self.RECEIVE_TIMEOUT
+            # Keep receiving into the preallocated buffer until we have a complete packet
+            while off < self.PACKET_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.sel.select(remaining):
+                    if off < max(min_size, 2):
+                        # not enough to return yet, keep waiting
+                        deadline = time.monotonic() + self.RECEIVE_TIMEOUT
+                        continue
+                    logger.debug("Audio chunk timed out: returning %d bytes instead of %d", off, self.PACKET_SIZE)
+                    break
+                n = self.conn.recv_into(mv[off:], self.PACKET_SIZE - off)
                 
                 # If we get empty data, the connection is closed
-                if not fragment:
-                    if not buffer:  # If buffer is also empty, return None
+                if n == 0:
+                    self._carry = b''
+                    if off == 0:  # If buffer is also empty, return None
                         return None
                     else:  # Otherwise return what we have with a warning
-                        print(f"WARNING: Received incomplete audio chunk: {len(buffer)} bytes instead of {self.PACKET_SIZE}")
-                        return buffer
-                
-                # Add the fragment to our buffer
-                buffer += fragment
-                bytes_needed = self.PACKET_SIZE - len(buffer)
+                        logger.warning("Received incomplete audio chunk: %d bytes instead of %d", off, self.PACKET_SIZE)
+                        return bytes(mv[:off]) if out is None else mv[:off]
                 
-                print(f"Received fragment: {len(fragment)} bytes, total so far: {len(buffer)}/{self.PACKET_SIZE}")
-                
-            print(f"Completed full audio chunk: {len(buffer)} bytes")
-            return buffer
+                off += n
+            
+            # return only whole 16 bit samples
+            end = off - off % 2
+            self._carry = bytes(mv[end:off])
+            return bytes(mv[:end]) if out is None else mv[:end]
             
         except ConnectionResetError:
             return None
         except socket.error as e:
-            print(f"Socket error: {e}")
+            logger.error(f"Socket error: {e}")
             return None
 
 
-import io
-import soundfile
-
 # wraps socket and ASR object, and serves one client connection. 
 # next client should be served by a new instance of this object
 class ServerProcessor:
@@ -139,30 +174,28 @@ class ServerProcessor:
         self.is_first = True
         self.chunk_num = 0
 
+        # preallocated buffers reused for every received chunk
+        self._buf = bytearray(self.connection.PACKET_SIZE)
+
     def receive_audio_chunk(self):
         # receive all audio that is available by this time
         # blocks operation if less than self.min_chunk seconds is available
         # unblocks if connection is closed or a chunk is available
-        out = []
         minlimit = self.min_chunk*SAMPLING_RATE
-        # while sum(len(x) for x in out) < minlimit:
-        raw_bytes = self.connection.non_blocking_receive_audio()
+        # the first chunk is not returned on timeout until it has at least min_chunk seconds of audio
+        min_size = min(int(minlimit)*2, self.connection.PACKET_SIZE) if self.is_first else 2
+        raw_bytes = self.connection.non_blocking_receive_audio(out=self._buf, min_size=min_size)
         if not raw_bytes:
-            # break
-            return None
-        print("received audio:",len(raw_bytes), "bytes", raw_bytes[:10])
-        sf = soundfile.SoundFile(io.BytesIO(raw_bytes), channels=1,endian="LITTLE",samplerate=SAMPLING_RATE, subtype="PCM_16",format="RAW")
-        audio, _ = librosa.load(sf,sr=SAMPLING_RATE,dtype=np.float32)
-        out.append(audio)
-        if not out:
-            return None
-        conc = np.concatenate(out)
-        if self.is_first and len(conc) < minlimit:
             return None
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("received audio: %d bytes %r", len(raw_bytes), bytes(raw_bytes[:10]))
+        # raw bytes are s16le mono at SAMPLING_RATE. They are returned as an int16 view of the receive buffer,
+        # which is overwritten by the next call; insert_audio_chunk scales them to float32.
+        audio = np.frombuffer(raw_bytes, dtype='<i2', count=len(raw_bytes)//2)
         self.is_first = False
         self.chunk_num += 1
-        print(f"[{self.chunk_num}]: received audio")
-        return np.concatenate(out)
+        logger.debug("[%d]: received audio", self.chunk_num)
+        return audio
 
     def format_output_transcript(self,o):
         # output format in stdout is like:
@@ -205,28 +238,62 @@ class ServerProcessor:
         msg = self.format_output_transcript(o)
         # remove all new lines
         msg = msg.replace("\n", " ")
-        print(f"send message: {msg}")
+        logger.debug("send message: %s", msg)
         if msg is not None:
             self.connection.send(msg)
 
+    def _recv_loop(self, chunks):
+        # producer thread: receives and decodes audio while the main thread runs the model.
+        # receive_audio_chunk reuses its output buffer, so every chunk is copied into the queue (as int16, half the size of float32),
+        # together with its chunk number, because self.chunk_num runs ahead of the chunk the model is processing.
+        try:
+            while True:
+                a = self.receive_audio_chunk()
+                if a is None:
+                    break
+                chunks.put((self.chunk_num, a.copy()))
+        except Exception as e:
+            logger.error(f"Error receiving audio: {e}")
+        finally:
+            # always wake up the main thread, also when receiving failed
+            chunks.put(None)
+
     def process(self):
         # handle one client connection
         self.online_asr_proc.init()
+        # at most two decoded chunks wait for the model, the receiver blocks when it is full
+        chunks = queue.Queue(maxsize=2)
+        receiver = threading.Thread(target=self._recv_loop, args=(chunks,), daemon=True)
+        receiver.start()
         while True:
-            a = self.receive_audio_chunk()
-            if a is None:
+            item = chunks.get()
+            if item is None:
                 break
+            chunk_num, a = item
             self.online_asr_proc.insert_audio_chunk(a)
             start_time = time.time()
             o = online.process_iter()
             end_time = time.time()
-            print(f"[{self.chunk_num}]: processing time: {end_time - start_time:.6f} seconds, start time: {start_time:.6f} seconds, end time: {end_time:.6f} seconds")
+            logger.debug("[%d]: processing time: %.6f seconds, start time: %.6f seconds, end time: %.6f seconds",
+                         chunk_num, end_time - start_time, start_time, end_time)
             try:
                 self.send_result(o)
             except Exception as e:
                 logger.error(f"Error sending result: {e}")
                 break
 
+        if receiver.is_alive():
+            # stopped early, wake up the receiver and drain the queue until it exits
+            try:
+                self.connection.conn.shutdown(socket.SHUT_RD)
+            except OSError:
+                pass
+            while receiver.is_alive() or not chunks.empty():
+                try:
+                    chunks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
 #        o = online.finish()  # this should be working
 #        self.send_result(o)
 
@@ -235,6 +302,11 @@ class ServerProcessor:
 # server loop
 
 with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+    # A large receive buffer lets an audio chunk arrive in few recv calls. It is set on the listening socket
+    # before listen(), so accepted connections inherit it and the window scale is negotiated with it.
+    # This is only a request: the kernel caps it at net.core.rmem_max (about 208 KB by default on Linux),
+    # and a fixed size turns off receive buffer autotuning.
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
     s.bind((args.host, args.port))
     s.listen(1)
     print('Listening on'+str((args.host, args.port)))
@@ -244,6 +316,6 @@ with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         connection = Connection(conn)
         proc = ServerProcessor(connection, online, args.min_chunk_size)
         proc.process()
-        conn.close()
+        connection.close()
         print('Connection to client closed')
 print('Connection closed, terminating.')